@@ -79,6 +79,26 @@ for key, val in _DEFAULTS.items():
         st.session_state[key] = val
 
 
+def _clear_output_dirs() -> int:
+    """Delete generated files from the output directories; return the count."""
+    count = 0
+    for directory in (AUDIO_DIR, VIDEO_DIR, FINAL_DIR):
+        if not directory.exists():
+            continue
+        # os.scandir reports the entry type from the directory listing itself,
+        # so there is no extra stat() per file as with Path.iterdir().
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                # BUG FIX: Only delete files, not subdirectories.
+                if entry.is_file(follow_symlinks=False):
+                    try:
+                        os.unlink(entry.path)
+                        count += 1
+                    except Exception:
+                        pass
+    return count
+
+
 # ═══════════════════════════════════════════════════════════════════════════
 #  Sidebar — Account Setup
 # ═══════════════════════════════════════════════════════════════════════════
@@ -121,16 +141,7 @@ with st.sidebar:
     st.divider()
     st.subheader("🧹 Maintenance")
     if st.button("🗑️ Clear Cache", use_container_width=True, help="Delete all temporary audio and video files"):
-        count = 0
-        for directory in (AUDIO_DIR, VIDEO_DIR, FINAL_DIR):
-            if directory.exists():
-                for f in directory.iterdir():
-                    if f.is_file():
-                        try:
-                            f.unlink()
-                            count += 1
-                        except Exception:
-                            pass
+        count = _clear_output_dirs()
         st.toast(f"Cleared {count} files.")
         st.rerun()
 
@@ -358,15 +369,7 @@ if st.session_state.final_video_path and Path(st.session_state.final_video_path)
     with col3:
         if st.button("❌ Discard", use_container_width=True):
             # Clean up generated files
-            for directory in (AUDIO_DIR, VIDEO_DIR, FINAL_DIR):
-                if directory.exists():
-                    for f in directory.iterdir():
-                        # BUG FIX: Only delete files, not subdirectories.
-                        if f.is_file():
-                            try:
-                                f.unlink()
-                            except Exception:
-                                pass
+            _clear_output_dirs()
 
             # Reset session
             for key in _DEFAULTS:
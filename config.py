@@ -46,9 +46,11 @@ OUTPUT_DIR = PROJECT_ROOT / "output"
 AUDIO_DIR = OUTPUT_DIR / "audio"
 VIDEO_DIR = OUTPUT_DIR / "video"
 FINAL_DIR = OUTPUT_DIR / "final"
+# Persistent lookups (encoder probes, API responses) — not wiped by "Clear Cache"
+CACHE_DIR = OUTPUT_DIR / "cache"
 
 # Create directories on import so other modules never hit FileNotFoundError
-for _dir in (AUDIO_DIR, VIDEO_DIR, FINAL_DIR):
+for _dir in (AUDIO_DIR, VIDEO_DIR, FINAL_DIR, CACHE_DIR):
     _dir.mkdir(parents=True, exist_ok=True)
 
 # ─── Pexels API ──────────────────────────────────────────────────────────
@@ -69,6 +71,15 @@ VIDEO_WIDTH = 1080
 VIDEO_HEIGHT = 1920
 VIDEO_FPS = 30
 
+# H.264 encoder for renders: auto / cuda / qsv / amf / videotoolbox / none.
+# "auto" uses the first hardware encoder that works, else libx264.
+# VIDEO_HWACCEL=auto in .env
+DEFAULT_HWACCEL = os.getenv("VIDEO_HWACCEL", "auto").strip().lower()
+
+# GPU index for NVENC encoding on multi-GPU hosts (empty = driver default).
+# NVENC_GPU=1 in .env
+NVENC_GPU = os.getenv("NVENC_GPU", "").strip()
+
 # ─── TTS (edge-tts) ─────────────────────────────────────────────────────
 # Full list of voices:  edge-tts --list-voices
 DEFAULT_TTS_VOICE = "en-US-ChristopherNeural"
@@ -90,6 +101,12 @@ REDDIT_USER_AGENT = os.getenv("REDDIT_USER_AGENT", "FacelessVideoPipeline/0.1.0"
 # HEADLESS_BROWSER=true/false in .env
 HEADLESS_BROWSER = os.getenv("HEADLESS_BROWSER", "false").lower() == "true"
 
+# Skip image decoding in the upload browser? (True/False)
+# Speeds up page loads, but YouTube Studio's thumbnail picker needs images,
+# so only enable this for TikTok-only runs.
+# BROWSER_DISABLE_IMAGES=true/false in .env
+BROWSER_DISABLE_IMAGES = os.getenv("BROWSER_DISABLE_IMAGES", "false").lower() == "true"
+
 # ─── Platform URLs ───────────────────────────────────────────────────────
 YOUTUBE_STUDIO_UPLOAD_URL = "https://studio.youtube.com"
 TIKTOK_UPLOAD_URL = "https://www.tiktok.com/creator#/upload?scene=creator_center"
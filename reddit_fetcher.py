@@ -21,6 +21,18 @@ FORBIDDEN_KEYWORDS = [
     "government", "war", "israel", "palestine", "russia", "ukraine", "protest", "riot"
 ]
 
+# One alternation compiled once instead of a regex search per keyword per post
+_FORBIDDEN_RE = re.compile(r"\b(?:" + "|".join(map(re.escape, FORBIDDEN_KEYWORDS)) + r")\b")
+
+# Shared session: listing and comment requests hit the same host, so reuse
+# one keep-alive connection instead of a new TCP+TLS handshake per request.
+# We use a browser-like User-Agent to avoid 403 Forbidden errors
+_session = requests.Session()
+_session.headers["User-Agent"] = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36"
+)
+
 SUBREDDITS = {
     "scary": ["shortscarystories", "nosleep", "creepy"],
     "funny": ["tifu", "funny", "humor"],
@@ -41,14 +53,9 @@ def get_reddit_story(category: str = "interesting", seen_ids: set | None = None)
     subreddit_name = random.choice(category_list)
     
     url = f"https://www.reddit.com/r/{subreddit_name}/hot.json?limit=25"
-    
-    # We use a browser-like User-Agent to avoid 403 Forbidden errors
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36"
-    }
 
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = _session.get(url, timeout=10)
         response.raise_for_status()
         data = response.json()
         
@@ -70,7 +77,7 @@ def get_reddit_story(category: str = "interesting", seen_ids: set | None = None)
             if not story_text.strip() and subreddit_name.lower() == "askreddit":
                 comment_url = f"https://www.reddit.com{post.get('permalink')}.json?limit=5"
                 try:
-                    c_resp = requests.get(comment_url, headers=headers, timeout=5)
+                    c_resp = _session.get(comment_url, timeout=5)
                     c_resp.raise_for_status()
                     c_data = c_resp.json()
                     # The second item in the list is the comments
@@ -89,13 +96,7 @@ def get_reddit_story(category: str = "interesting", seen_ids: set | None = None)
 
             # Check for forbidden keywords using word boundaries for better accuracy
             content_lower = (story_title + " " + story_text).lower()
-            found_forbidden = False
-            for kw in FORBIDDEN_KEYWORDS:
-                if re.search(rf"\b{re.escape(kw)}\b", content_lower):
-                    found_forbidden = True
-                    break
-
-            if found_forbidden:
+            if _FORBIDDEN_RE.search(content_lower):
                 continue
 
             # Length check for Shorts (approx 30-600 words)
@@ -35,6 +35,7 @@ from config import ( # type: ignore
     YOUTUBE_STUDIO_UPLOAD_URL,
     TIKTOK_UPLOAD_URL,
     HEADLESS_BROWSER,
+    BROWSER_DISABLE_IMAGES,
 )
 
 
@@ -60,17 +61,30 @@ def _get_browser_context(playwright):
         except Exception:
              pass
 
+    args = [
+        "--disable-blink-features=AutomationControlled",
+        "--no-first-run",
+        "--no-default-browser-check",
+        "--no-sandbox",
+        "--disable-extensions",
+        "--disable-dev-shm-usage",  # Added for stability
+        # Cut background work that competes with the upload flow
+        "--disable-gpu",
+        "--disable-background-networking",
+        "--disable-sync",
+        "--metrics-recording-only",
+        "--disable-component-update",
+        "--disable-domain-reliability",
+        "--disable-features=TranslateUI,BlinkGenPropertyTrees",
+    ]
+    if BROWSER_DISABLE_IMAGES:
+        args.append("--blink-settings=imagesEnabled=false")
+
     context = playwright.chromium.launch_persistent_context(
         user_data_dir=BROWSER_USER_DATA_DIR,
         headless=HEADLESS_BROWSER,
-        args=[
-            "--disable-blink-features=AutomationControlled",
-            "--no-first-run",
-            "--no-default-browser-check",
-            "--no-sandbox",
-            "--disable-extensions",
-            "--disable-dev-shm-usage",  # Added for stability
-        ],
+        args=args,
+        ignore_default_args=["--enable-automation"],
         viewport={"width": 1280, "height": 900},
         accept_downloads=True,
     )
@@ -1,6 +1,7 @@
 import sys
 import os
 import importlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 print("Python executable:", sys.executable)
@@ -25,13 +26,33 @@ modules = [
     "praw"
 ]
 
-failed = []
-for m in modules:
+
+def _safe_import(name: str) -> tuple[bool, str | None]:
+    """Import *name*, returning (ok, error message)."""
     try:
-        importlib.import_module(m)
+        importlib.import_module(name)
+        return True, None
+    except Exception as e:
+        # Not just ImportError: a module can fail at import time for other reasons
+        return False, f"{type(e).__name__}: {e}"
+
+
+# Imports are I/O bound on a cold start (reading/decoding .pyc files), so
+# overlap them to warm things up.
+with ThreadPoolExecutor(max_workers=4) as ex:
+    results = list(ex.map(lambda m: (m, _safe_import(m)), modules))
+
+# Modules importing each other from different threads can trip importlib's
+# deadlock detection, so a parallel failure is not final: retry each one
+# alone on the main thread and report only what still fails there.
+results = [(m, (ok, err) if ok else _safe_import(m)) for m, (ok, err) in results]
+
+failed = []
+for m, (ok, err) in results:
+    if ok:
         print(f"SUCCESS: Imported {m}")
-    except ImportError as e:
-        print(f"FAILURE: Failed to import {m}: {e}")
+    else:
+        print(f"FAILURE: Failed to import {m}: {err}")
         failed.append(m)
 
 if failed:
@@ -1,11 +1,21 @@
 """
 video_engine.py — Merge audio + background video into a final 9:16 short.
 
-Uses moviepy to composite the video, looping short clips to match
-the audio duration, and exporting a ready-to-upload MP4.
+Clips that already match the output format are stream-copied. Otherwise
+one ffmpeg filter graph loops, scales, crops and concatenates them and
+muxes the narration in a single pass. moviepy is only the fallback when
+that render fails. The result is a ready-to-upload MP4.
 """
 
+import functools
+import json
 import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from fractions import Fraction
 from pathlib import Path
 
 from moviepy import (
@@ -14,16 +24,189 @@ from moviepy import (
     concatenate_videoclips,
     vfx,
 )
+from moviepy.config import FFMPEG_BINARY
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+from mutagen import File as MutagenFile, MutagenError  # type: ignore
 
-from config import VIDEO_WIDTH, VIDEO_HEIGHT, VIDEO_FPS, FINAL_DIR
+from config import (
+    VIDEO_WIDTH,
+    VIDEO_HEIGHT,
+    VIDEO_FPS,
+    FINAL_DIR,
+    CACHE_DIR,
+    NVENC_GPU,
+    DEFAULT_HWACCEL,
+)
 
 logger = logging.getLogger(__name__)
 
 
+_ENCODER_CACHE_FILE = CACHE_DIR / "encoders.json"
+# Re-probe an encoder this long after a failed probe
+_ENCODER_RETRY_AFTER = 60 * 60
+
+# hwaccel name → ffmpeg H.264 encoder, in "auto" preference order
+_HW_ENCODERS = {
+    "cuda": "h264_nvenc",
+    "qsv": "h264_qsv",
+    "amf": "h264_amf",
+    "videotoolbox": "h264_videotoolbox",
+}
+
+# "-gpu" is a private option of the h264_nvenc encoder, so it must follow
+# "-c:v h264_nvenc" on the output side, never precede an input.
+_NVENC_GPU_ARGS = ["-gpu", NVENC_GPU] if NVENC_GPU else []
+
+
+def _probe_encoder(codec: str) -> bool:
+    """Return True if the ffmpeg build used by moviepy can actually encode with *codec*."""
+    # Test the exact options the render passes (presets, rate control, GPU),
+    # so a build that takes the bare encoder but rejects one of them fails
+    # here rather than mid-render. -movflags is for the MP4 muxer only.
+    settings = _encoder_settings(codec)
+    params = list(settings["ffmpeg_params"])
+    if "-movflags" in params:
+        i = params.index("-movflags")
+        del params[i:i + 2]
+    try:
+        # A tiny test encode also catches builds that list a hardware
+        # encoder but have no usable device/driver at runtime.
+        result = subprocess.run(
+            [
+                FFMPEG_BINARY, "-hide_banner", "-loglevel", "error",
+                "-f", "lavfi", "-i", "color=size=256x256:rate=1:duration=1",
+                "-c:v", codec, "-preset", settings["preset"], *params,
+                "-f", "null", "-",
+            ],
+            capture_output=True,
+            text=True,
+            timeout=30,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return result.returncode == 0
+
+
+def _ffmpeg_fingerprint() -> str:
+    """Identify the ffmpeg binary (and NVENC device) without running a subprocess."""
+    exe = shutil.which(FFMPEG_BINARY) or FFMPEG_BINARY
+    try:
+        st = os.stat(exe)
+    except OSError:
+        return exe
+    return f"{exe}:{st.st_size}:{st.st_mtime_ns}:gpu={NVENC_GPU}"
+
+
+def _encoder_usable(codec: str) -> bool:
+    """
+    Whether *codec* works on this machine. Probe results are persisted in
+    the cache directory, keyed on the ffmpeg binary, so later runs skip the
+    test encode. A failed probe is only trusted for _ENCODER_RETRY_AFTER:
+    a busy GPU, a timeout under load or a driver installed later must not
+    pin "auto" to libx264 for good.
+    """
+    fingerprint = _ffmpeg_fingerprint()
+    # codec -> True if usable, else the time of the last failed probe
+    known: dict[str, bool | float] = {}
+    try:
+        cached = json.loads(_ENCODER_CACHE_FILE.read_text(encoding="utf-8"))
+        if cached.get("ffmpeg") == fingerprint:
+            known = cached["encoders"]
+    except (OSError, ValueError, KeyError):
+        pass
+    entry = known.get(codec)
+    if entry is True:
+        return True
+    # Older caches stored False, which counts as a failure at time 0
+    if isinstance(entry, (int, float)) and time.time() - entry < _ENCODER_RETRY_AFTER:
+        return False
+
+    usable = _probe_encoder(codec)
+    logger.info("Encoder %s %s.", codec, "available" if usable else "not available")
+    known[codec] = True if usable else time.time()
+    try:
+        _ENCODER_CACHE_FILE.write_text(
+            json.dumps({"ffmpeg": fingerprint, "encoders": known}),
+            encoding="utf-8",
+        )
+    except OSError:
+        pass
+    return usable
+
+
+def _forget_encoder(codec: str) -> None:
+    """Drop the cached probe result for *codec*, e.g. after it failed a real render."""
+    try:
+        cached = json.loads(_ENCODER_CACHE_FILE.read_text(encoding="utf-8"))
+        cached["encoders"].pop(codec, None)
+        _ENCODER_CACHE_FILE.write_text(json.dumps(cached), encoding="utf-8")
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass
+
+
+@functools.cache
+def _ffmpeg_hwaccels() -> frozenset[str]:
+    """Hardware decode methods the ffmpeg build supports (``ffmpeg -hwaccels``)."""
+    try:
+        result = subprocess.run(
+            [FFMPEG_BINARY, "-hide_banner", "-hwaccels"],
+            capture_output=True,
+            text=True,
+            timeout=15,
+            check=True,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return frozenset()
+    # First line is the "Hardware acceleration methods:" header
+    return frozenset(line.strip() for line in result.stdout.splitlines()[1:] if line.strip())
+
+
+def _select_encoder(hwaccel: str) -> str:
+    """Map a *hwaccel* choice to a usable H.264 encoder, defaulting to libx264."""
+    hwaccel = hwaccel.lower()
+    if hwaccel in ("none", "cpu"):
+        return "libx264"
+    if hwaccel == "auto":
+        for codec in _HW_ENCODERS.values():
+            if _encoder_usable(codec):
+                return codec
+        return "libx264"
+    if hwaccel not in _HW_ENCODERS:
+        raise ValueError(
+            f"Unknown hwaccel '{hwaccel}'. "
+            f"Expected one of: auto, none, {', '.join(_HW_ENCODERS)}."
+        )
+    codec = _HW_ENCODERS[hwaccel]
+    if _encoder_usable(codec):
+        return codec
+    logger.warning("%s encoder %s is not usable here, using libx264.", hwaccel, codec)
+    return "libx264"
+
+
+def _find_ffprobe() -> str | None:
+    """Locate ffprobe next to moviepy's ffmpeg binary, else on PATH."""
+    ffmpeg = Path(FFMPEG_BINARY)
+    sibling = ffmpeg.with_name("ffprobe" + ffmpeg.suffix)
+    if sibling.is_file():
+        return str(sibling)
+    return shutil.which("ffprobe")
+
+
+_FFPROBE_BINARY = _find_ffprobe()
+if _FFPROBE_BINARY is None:
+    # imageio-ffmpeg (moviepy's default binary) ships no ffprobe
+    logger.warning(
+        "ffprobe not found; probing clips via ffmpeg's header parse. Output "
+        "checks use container durations and stream copy is disabled."
+    )
+
+
 def render_final_video(
     audio_path: str | Path,
     video_source: str | Path | list[dict],
     output_path: str | Path | None = None,
+    hwaccel: str = DEFAULT_HWACCEL,
+    preset: str = "veryfast",
 ) -> str:
     """
     Composite *audio_path* over *video_source* into a final 1080x1920 MP4.
@@ -31,6 +214,14 @@ def render_final_video(
     *video_source* can be:
     - A single path to an MP4 (legacy).
     - A list of dicts like [{"path": "...", "duration": 5.0}, ...].
+
+    *hwaccel* picks the H.264 encoder: ``"auto"`` (first usable hardware
+    encoder), ``"cuda"``, ``"qsv"``, ``"amf"``, ``"videotoolbox"``, or
+    ``"none"`` for libx264. Unusable hardware falls back to libx264.
+
+    *preset* is the libx264 preset; batch renders favour throughput, pass
+    ``"medium"`` or ``"slow"`` when quality matters more. Hardware encoders
+    use their own presets.
     """
     audio_path = Path(audio_path)
     if not audio_path.is_file():
@@ -40,30 +231,71 @@ def render_final_video(
         output_path = FINAL_DIR / "final_video.mp4"
     output_path = Path(output_path)
     output_path.parent.mkdir(parents=True, exist_ok=True)
+    # Render into a hidden sibling and rename on success: same directory means
+    # same filesystem, so os.replace is atomic and the preview never sees a
+    # half-written file (or loses the previous video if this render fails).
+    temp_path = output_path.parent / f".{output_path.stem}.part{output_path.suffix}"
 
     audio_clip = None
-    clips_to_close = []
+    # Opened source clips by resolved path. Segments cut from the same file
+    # share one reader (one ffmpeg decoder) and these are what get closed.
+    sources: dict[str, VideoFileClip] = {}
+    scratch_dir = None
 
     try:
-        logger.info("Loading audio: %s", audio_path.name)
-        audio_clip = AudioFileClip(str(audio_path))
-        audio_duration = audio_clip.duration
+        audio_duration = _audio_duration(audio_path)
 
         if isinstance(video_source, (str, Path)):
-            # Single video mode
-            video_clips = [_prepare_clip(video_source, audio_duration)]
-        else:
-            # Multi-clip mode
-            video_clips = []
-            for item in video_source:
-                clip = _prepare_clip(item["path"], item["duration"])
-                video_clips.append(clip)
-        
-        clips_to_close.extend(video_clips)
+            # Single video mode: one segment spanning the whole narration, so a
+            # source already at 1080x1920 H.264 is muxed without re-encoding.
+            video_source = [{"path": video_source, "duration": audio_duration}]
+
+        if _can_stream_copy(video_source):
+            logger.info("All %d clip(s) already match the output format, stream-copying.", len(video_source))
+            try:
+                _concat_copy(video_source, audio_path, audio_duration, temp_path)
+                _verify_output(temp_path, audio_duration)
+                os.replace(temp_path, output_path)
+                return str(output_path.resolve())
+            except (OSError, RuntimeError, subprocess.CalledProcessError) as exc:
+                logger.warning("Stream-copy concat failed (%s), re-encoding instead.", _ffmpeg_error(exc))
+
+        # Only resolved once an encode is needed: the first "auto" selection
+        # on a machine runs test encodes, which a stream copy never needs.
+        settings = _encoder_settings(_select_encoder(hwaccel), x264_preset=preset)
+        logger.info("Rendering %d clip(s) with ffmpeg...", len(video_source))
+        while True:
+            try:
+                _render_with_ffmpeg(video_source, audio_path, audio_duration, temp_path, settings)
+                _verify_output(temp_path, audio_duration)
+                os.replace(temp_path, output_path)
+                return str(output_path.resolve())
+            except (OSError, RuntimeError, subprocess.CalledProcessError) as exc:
+                if settings["codec"] == "libx264" or not _is_encoder_error(exc, settings["codec"]):
+                    logger.warning("ffmpeg render failed (%s), falling back to moviepy.", _ffmpeg_error(exc))
+                    break
+                # A hardware encoder can pass the probe and still fail here
+                # (driver or GPU changed since it was cached): forget it and
+                # retry once on libx264, which the moviepy fallback then uses.
+                logger.warning("%s render failed (%s), retrying with libx264.", settings["codec"], _ffmpeg_error(exc))
+                _forget_encoder(settings["codec"])
+                settings = _encoder_settings("libx264", x264_preset=preset)
+
+        # Short clips get looped into here by ffmpeg before moviepy opens them
+        scratch_dir = Path(tempfile.mkdtemp(prefix="loops-", dir=CACHE_DIR))
+        video_clips = []
+        for item in video_source:
+            clip = _prepare_clip(item["path"], item["duration"], sources, scratch_dir)
+            video_clips.append(clip)
 
-        # Stitch clips together
+        # Stitch clips together. _prepare_clip crops every clip to exactly the
+        # output size, so "chain" (no per-frame compositing) is safe; keep
+        # "compose" as a guard in case a clip ever comes back a different size.
+        uniform = all((c.w, c.h) == (VIDEO_WIDTH, VIDEO_HEIGHT) for c in video_clips)
+        if not uniform:
+            logger.warning("Clip sizes differ from %dx%d, compositing instead of chaining.", VIDEO_WIDTH, VIDEO_HEIGHT)
         logger.info("Stitching %d clips...", len(video_clips))
-        final_video = concatenate_videoclips(video_clips, method="compose")
+        final_video = concatenate_videoclips(video_clips, method="chain" if uniform else "compose")
         
         # Ensure it matches audio duration exactly (trim/loop last bit if needed)
         if final_video.duration > audio_duration:
@@ -72,18 +304,13 @@ def render_final_video(
             # This shouldn't happen much with our math, but just in case
             final_video = final_video.with_effects([vfx.Loop(duration=audio_duration)])
 
+        logger.info("Loading audio: %s", audio_path.name)
+        audio_clip = AudioFileClip(str(audio_path))
         final_clip = final_video.with_audio(audio_clip)
         
         logger.info("Rendering final video → %s", output_path.name)
-        final_clip.write_videofile(
-            str(output_path),
-            fps=VIDEO_FPS,
-            codec="libx264",
-            audio_codec="aac",
-            preset="medium",
-            threads=4,
-            logger=None,
-        )
+        _write_video(final_clip, temp_path, settings)
+        os.replace(temp_path, output_path)
 
         final_path = str(output_path.resolve())
         # Close explicitly before returning
@@ -96,26 +323,410 @@ def render_final_video(
         logger.error("Video rendering failed: %s", exc)
         raise
     finally:
+        temp_path.unlink(missing_ok=True)
         if audio_clip:
             try:
                 audio_clip.close()
             except Exception:
                 pass
-        for clip in clips_to_close:
+        for clip in sources.values():
             try:
                 clip.close()
             except Exception:
                 pass
+        if scratch_dir is not None:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
             
     return ""  # Should not be reached due to raise in except
 
 
-def _prepare_clip(path: str | Path, target_duration: float) -> VideoFileClip:
-    """Load, resize, and loop/trim a clip to match target duration."""
-    clip = VideoFileClip(str(path))
+def _ffmpeg_error(exc: Exception, max_lines: int = 10) -> str:
+    """Describe *exc*, with the tail of ffmpeg's stderr when it has one."""
+    # CalledProcessError's own message is only the command and exit code
+    stderr = getattr(exc, "stderr", None)
+    if isinstance(exc, subprocess.CalledProcessError) and stderr:
+        tail = "\n".join(stderr.strip().splitlines()[-max_lines:])
+        return f"exit status {exc.returncode}: {tail}"
+    return str(exc)
+
+
+def _is_encoder_error(exc: Exception, codec: str) -> bool:
+    """
+    True if a failed ffmpeg run points at the video encoder itself, not at
+    an input clip or the output check, so only then is *codec* blamed.
+    """
+    if not isinstance(exc, subprocess.CalledProcessError):
+        return False
+    stderr = exc.stderr or ""
+    # Encoder messages are tagged "[h264_nvenc @ 0x...]" (or
+    # "[vost#0:0/h264_nvenc @ ...]"); init failures also name the encoder.
+    return any(
+        marker in stderr
+        for marker in (f"{codec} @", "opening encoder", "Unknown encoder", "Error setting option")
+    )
+
+
+def _audio_duration(path: Path) -> float:
+    """Narration length in seconds, read from the file header when possible."""
+    # Only the moviepy fallback needs decoded audio; the ffmpeg paths just
+    # need the length, which mutagen reads without spawning ffmpeg.
+    try:
+        audio_info = MutagenFile(str(path))
+    except MutagenError:
+        audio_info = None
+    if audio_info is not None and audio_info.info.length > 0:
+        return audio_info.info.length
+    with AudioFileClip(str(path)) as clip:
+        return clip.duration
+
+
+def _probe(path: str | Path) -> dict | None:
+    """
+    Return ffprobe info for the first video stream of *path*, or None if
+    the file cannot be read. Without ffprobe, see _parse_with_ffmpeg().
+
+    ``"duration"`` is the video stream's own duration, so an audio track
+    that outlasts the video cannot hide a short video; it falls back to the
+    container duration only for streams that report none (e.g. some MKVs).
+    Results are memoized per file version, so the stream-copy check, the
+    fallback clip loader and output verification share one ffprobe run.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    # Clip files are overwritten between runs, so key on size/mtime too
+    return _probe_file(str(Path(path).resolve()), st.st_size, st.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=128)
+def _probe_file(path: str, size: int, mtime_ns: int) -> dict | None:
+    """Run ffprobe on *path*; see _probe(). Treat the result as read-only."""
+    if _FFPROBE_BINARY is None:
+        return _parse_with_ffmpeg(path)
+    try:
+        result = subprocess.run(
+            [
+                _FFPROBE_BINARY, "-v", "error",
+                "-select_streams", "v:0",
+                "-show_entries", "stream=codec_name,width,height,r_frame_rate,pix_fmt,duration:format=duration",
+                "-of", "json",
+                str(path),
+            ],
+            capture_output=True,
+            text=True,
+            timeout=15,
+            check=True,
+        )
+        info = json.loads(result.stdout)
+        stream = info["streams"][0]
+        stream["duration"] = _as_seconds(stream.get("duration")) or _as_seconds(
+            info.get("format", {}).get("duration")
+        )
+    except (OSError, subprocess.SubprocessError, ValueError, KeyError, IndexError):
+        return None
+    return stream
+
+
+def _parse_with_ffmpeg(path: str) -> dict | None:
+    """
+    Fallback for _probe_file() when there is no ffprobe: moviepy's parse of
+    ``ffmpeg -i`` output, in the same shape. It has no pixel format (so
+    _can_stream_copy never passes) and only the container duration.
+    """
+    try:
+        infos = ffmpeg_parse_infos(path)
+    except Exception:
+        # moviepy raises assorted errors (IOError, KeyError, ...) for unreadable files
+        return None
+    if not infos.get("video_found") or not infos.get("video_size"):
+        return None
+    width, height = infos["video_size"]
+    return {
+        "codec_name": infos.get("video_codec_name"),
+        "width": width,
+        "height": height,
+        "r_frame_rate": str(infos.get("video_fps") or 0),
+        "duration": float(infos.get("video_duration") or infos.get("duration") or 0),
+    }
+
+
+def _as_seconds(value: str | None) -> float:
+    """ffprobe duration string to seconds; 0 when missing or "N/A"."""
+    try:
+        return float(value or 0)
+    except ValueError:
+        return 0.0
+
+
+def _can_stream_copy(video_source: list[dict]) -> bool:
+    """True if every clip is already H.264 yuv420p at the output size and fps."""
+    for item in video_source:
+        info = _probe(item["path"])
+        if info is None:
+            return False
+        try:
+            fps = float(Fraction(info.get("r_frame_rate", "0/1")))
+        except (ValueError, ZeroDivisionError):
+            return False
+        if (
+            info.get("codec_name") != "h264"
+            or info.get("pix_fmt") != "yuv420p"
+            or info.get("width") != VIDEO_WIDTH
+            or info.get("height") != VIDEO_HEIGHT
+            or abs(fps - VIDEO_FPS) > 0.01
+            or info["duration"] < item["duration"]
+        ):
+            return False
+    return True
+
+
+def _concat_copy(
+    video_source: list[dict],
+    audio_path: Path,
+    audio_duration: float,
+    output_path: Path,
+) -> None:
+    """Join clips with ffmpeg's concat demuxer and mux audio, without re-encoding video."""
+    list_path = output_path.with_suffix(".concat.txt")
+    entries = []
+    for item in video_source:
+        clip_path = Path(item["path"]).resolve().as_posix().replace("'", "'\\''")
+        entries.append(f"file '{clip_path}'\ninpoint 0\noutpoint {item['duration']:.3f}\n")
+    list_path.write_text("".join(entries), encoding="utf-8")
+
+    try:
+        subprocess.run(
+            [
+                FFMPEG_BINARY, "-y", "-hide_banner", "-loglevel", "error",
+                "-f", "concat", "-safe", "0", "-i", str(list_path),
+                "-i", str(audio_path),
+                "-map", "0:v:0", "-map", "1:a:0",
+                "-c:v", "copy", "-c:a", "aac",
+                "-t", f"{audio_duration:.3f}",
+                "-movflags", "+faststart",
+                str(output_path),
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    finally:
+        list_path.unlink(missing_ok=True)
+
+
+def _verify_output(path: Path, expected_duration: float) -> None:
+    """
+    Cheap structural check of an ffmpeg-written MP4: the probe only reads the
+    container header (moov is at the front thanks to +faststart), so this
+    catches truncated or empty output without decoding any frames.
+    """
+    info = _probe(path)
+    if info is None:
+        raise RuntimeError(f"Output is not a readable video: {path.name}")
+    if info.get("codec_name") != "h264" or info["duration"] < expected_duration - 0.1:
+        raise RuntimeError(
+            f"Output looks truncated: {info.get('codec_name')} "
+            f"{info['duration']:.2f}s < {expected_duration:.2f}s"
+        )
+
+
+def _render_with_ffmpeg(
+    video_source: list[dict],
+    audio_path: Path,
+    audio_duration: float,
+    output_path: Path,
+    settings: dict,
+) -> None:
+    """
+    Loop/trim, scale, center-crop, re-time and concatenate every clip in a
+    single ffmpeg filter graph, and mux the narration in the same pass.
+
+    No frame ever crosses into Python, and one process instead of one per
+    clip saves N-1 ffmpeg startups and filter-graph inits, which dominate
+    for short (<10 s) segments. ``-stream_loop -1`` loops short clips in
+    the demuxer.
+    """
+    # With NVENC, decode on NVDEC too. Frames are handed back to the CPU
+    # filter graph (crop/concat have no CUDA equivalents in stock builds),
+    # and ffmpeg falls back to software decoding for unsupported streams.
+    decode_args = []
+    if settings["codec"] == "h264_nvenc" and "cuda" in _ffmpeg_hwaccels():
+        decode_args = ["-hwaccel", "cuda", *(["-hwaccel_device", NVENC_GPU] if NVENC_GPU else [])]
+
+    inputs = []
+    chains = []
+    for i, item in enumerate(video_source):
+        inputs += [*decode_args, "-stream_loop", "-1", "-t", f"{item['duration']:.3f}", "-i", str(item["path"])]
+        chains.append(
+            f"[{i}:v]scale={VIDEO_WIDTH}:{VIDEO_HEIGHT}:force_original_aspect_ratio=increase,"
+            f"crop={VIDEO_WIDTH}:{VIDEO_HEIGHT},setsar=1,fps={VIDEO_FPS}[v{i}]"
+        )
+    labels = "".join(f"[v{i}]" for i in range(len(video_source)))
+    graph = ";".join(chains) + f";{labels}concat=n={len(video_source)}:v=1:a=0[outv]"
+
+    subprocess.run(
+        [
+            FFMPEG_BINARY, "-y", "-hide_banner", "-loglevel", "error",
+            *inputs,
+            "-i", str(audio_path),
+            "-filter_complex", graph,
+            "-map", "[outv]", "-map", f"{len(video_source)}:a:0",
+            "-c:v", settings["codec"], "-preset", settings["preset"], *settings["ffmpeg_params"],
+            "-c:a", "aac",
+            "-t", f"{audio_duration:.3f}",
+            str(output_path),
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def _encoder_settings(codec: str, x264_preset: str = "veryfast") -> dict:
+    """Return codec, preset and extra ffmpeg params for an H.264 encoder."""
+    if codec == "h264_nvenc":
+        return {
+            "codec": codec,
+            "preset": "p5",
+            "ffmpeg_params": [
+                "-tune", "hq",
+                "-rc", "vbr",
+                "-cq", "23",
+                *_NVENC_GPU_ARGS,
+                "-pix_fmt", "yuv420p",
+                "-movflags", "+faststart",
+            ],
+        }
+    if codec == "h264_qsv":
+        return {
+            "codec": codec,
+            "preset": "veryfast",
+            "ffmpeg_params": ["-global_quality", "23", "-pix_fmt", "nv12", "-movflags", "+faststart"],
+        }
+    if codec == "h264_amf":
+        # moviepy always emits "-preset"; "medium" is not a valid AMF preset,
+        # so pass the AMF name and set the equivalent -quality explicitly.
+        return {
+            "codec": codec,
+            "preset": "speed",
+            "ffmpeg_params": ["-quality", "speed", "-pix_fmt", "yuv420p", "-movflags", "+faststart"],
+        }
+    if codec == "h264_videotoolbox":
+        # VideoToolbox has no presets (the flag is ignored); bitrate drives quality.
+        return {
+            "codec": codec,
+            "preset": "medium",
+            "ffmpeg_params": ["-b:v", "8M", "-pix_fmt", "yuv420p", "-movflags", "+faststart"],
+        }
+    # Stock-footage backgrounds don't reward x264's heavier motion search;
+    # a 2 s GOP without B-frames also keeps uploads quick to seek/thumbnail.
+    return {
+        "codec": "libx264",
+        "preset": x264_preset,
+        "ffmpeg_params": [
+            "-crf", "23",
+            "-tune", "fastdecode",
+            "-g", str(VIDEO_FPS * 2),
+            "-keyint_min", str(VIDEO_FPS),
+            "-bf", "0",
+            # Frame threading scales with cores far better than slices. The
+            # preset's lookahead stays: zeroing it would disable mb-tree at CRF.
+            "-x264-params", "sliced-threads=0",
+            "-pix_fmt", "yuv420p",
+            "-movflags", "+faststart",
+        ],
+    }
+
+
+def _write_video(clip, output_path: Path, settings: dict) -> None:
+    """Encode *clip* with moviepy using the given encoder *settings*."""
+    clip.write_videofile(
+        str(output_path),
+        fps=VIDEO_FPS,
+        audio_codec="aac",
+        # 0 lets the encoder size its thread pool (x264 uses ~1.5x cores)
+        threads=0,
+        logger=None,
+        **settings,
+    )
+
+
+def _loop_with_ffmpeg(path: str | Path, duration: float, scratch_dir: Path) -> Path | None:
+    """
+    Stream-copy *path* looped to at least *duration* seconds into *scratch_dir*.
+
+    ``-stream_loop`` loops in the demuxer, whereas vfx.Loop seeks moviepy's
+    reader back to the start (restarting its ffmpeg process) on every pass.
+    Returns None if ffmpeg fails.
+    """
+    fd, looped = tempfile.mkstemp(suffix=Path(path).suffix or ".mp4", dir=scratch_dir)
+    os.close(fd)
+    try:
+        subprocess.run(
+            [
+                FFMPEG_BINARY, "-y", "-hide_banner", "-loglevel", "error",
+                "-stream_loop", "-1", "-i", str(path),
+                # Copying cuts on packet boundaries; the margin keeps it from ending short
+                "-t", f"{duration + 1:.3f}",
+                "-map", "0:v:0", "-c", "copy",
+                looped,
+            ],
+            capture_output=True,
+            text=True,
+            timeout=120,
+            check=True,
+        )
+    except (OSError, subprocess.SubprocessError) as exc:
+        logger.debug("ffmpeg loop of %s failed: %s", path, exc)
+        return None
+    return Path(looped)
+
+
+def _prepare_clip(
+    path: str | Path,
+    target_duration: float,
+    sources: dict[str, VideoFileClip] | None = None,
+    scratch_dir: Path | None = None,
+) -> VideoFileClip:
+    """
+    Load, resize, and loop/trim a clip to match target duration.
+
+    If *sources* is given, the opened source clip is stored there by resolved
+    path and reused when the same file comes up again; the caller closes them.
+    If *scratch_dir* is given, clips shorter than the target are looped into
+    it by ffmpeg first; the caller removes it.
+    """
+    target_ratio = VIDEO_WIDTH / VIDEO_HEIGHT
+    # Size and length come from one (cached) ffprobe call, so the scaling
+    # and looping decisions are made before the clip is opened.
+    info = _probe(path)
+    if scratch_dir is not None and info is not None and 0 < info["duration"] < target_duration:
+        looped = _loop_with_ffmpeg(path, target_duration, scratch_dir)
+        if looped is not None:
+            path, info = looped, _probe(looped)
+    key = str(Path(path).resolve())
+    # audio=False: the narration replaces the stock audio, so its reader
+    # (an extra ffmpeg process per clip) is never needed.
+    if sources is not None and key in sources:
+        # Effects below return copies, so the shared source is never mutated
+        clip = sources[key]
+    elif info is not None and info.get("width") and info.get("height"):
+        # Have ffmpeg's scaler size frames at decode time so no full-size
+        # intermediate frame is materialized before the crop.
+        if info["width"] / info["height"] > target_ratio:
+            target_resolution = (None, VIDEO_HEIGHT)
+        else:
+            target_resolution = (VIDEO_WIDTH, None)
+        clip = VideoFileClip(str(path), audio=False, target_resolution=target_resolution)
+    else:
+        clip = VideoFileClip(str(path), audio=False)
+    if sources is not None:
+        sources.setdefault(key, clip)
+    source_duration = info["duration"] if info and info["duration"] > 0 else clip.duration
     
     # 1. Loop if shorter than target
-    if clip.duration < target_duration:
+    if source_duration < target_duration:
         clip = clip.with_effects([vfx.Loop(duration=target_duration)])
     
     # 2. Trim to target
@@ -123,10 +734,12 @@ def _prepare_clip(path: str | Path, target_duration: float) -> VideoFileClip:
     
     # 3. Resize and crop (Cover strategy: ensure 1080x1920 is fully filled)
     w, h = clip.w, clip.h
-    target_ratio = VIDEO_WIDTH / VIDEO_HEIGHT
-    current_ratio = w / h
+    covered = (w == VIDEO_WIDTH and h >= VIDEO_HEIGHT) or (h == VIDEO_HEIGHT and w >= VIDEO_WIDTH)
 
-    if current_ratio > target_ratio:
+    if covered:
+        # Already scaled by ffmpeg at decode time
+        pass
+    elif w / h > target_ratio:
         # Video is wider than target: scale based on height
         clip = clip.resized(height=VIDEO_HEIGHT)
     else:
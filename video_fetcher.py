@@ -2,26 +2,90 @@
 video_fetcher.py — Download portrait stock videos from the Pexels API.
 
 Searches for vertical (9:16) videos matching a keyword and downloads
-the best-quality MP4 available. If no single video is long enough for
-the audio, the shortest acceptable match (or the longest available) is
-returned — ``video_engine.py`` will loop it to fit.
+the smallest MP4 rendition that still covers the output height. If no
+single video is long enough for the audio, the shortest acceptable match
+(or the longest available) is returned — ``video_engine.py`` will loop
+it to fit.
 """
 
+import gzip
+import hashlib
+import json
 import logging
+import os
 import random
 import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
 from pathlib import Path
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from config import PEXELS_API_KEY, VIDEO_DIR
+try:
+    # Optional: faster parsing of search responses and cache entries
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
+from config import PEXELS_API_KEY, VIDEO_DIR, VIDEO_HEIGHT, CACHE_DIR
 
 logger = logging.getLogger(__name__)
 
 _PEXELS_SEARCH_URL = "https://api.pexels.com/videos/search"
 
-# Shared requests session for performance and connection pooling
+# Built once; sent only to the API, not set on the session, because the
+# session also downloads from CDN links that may be on third-party hosts.
+_AUTH_HEADERS = {"Authorization": PEXELS_API_KEY}
+
+# Shared requests session for performance and connection pooling. Parallel
+# clip fetches hit api.pexels.com and videos.pexels.com at once, so keep
+# enough warm connections per host, and retry rate limits / 5xx with backoff.
 _session = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+)
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
+
+# Sentence boundary (after . ! or ?) and whitespace-run patterns
+_SENT_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+_WS_RE = re.compile(r'\s+')
+
+# Concurrent downloads / per-segment searches in get_clips_for_script.
+# Searches are small API calls, so more of them can be in flight.
+_MAX_FETCH_WORKERS = 5
+_MAX_SEARCH_WORKERS = 8
+
+# Pexels caps per_page at 80
+_MAX_PER_PAGE = 80
+
+# Copy buffer for downloads; fewer, larger reads suit big MP4s
+_DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+
+# MP4 is already compressed, so ask for the bytes as-is and keep the body
+# out of urllib3's decoder. API searches keep gzip: JSON compresses well.
+_DOWNLOAD_HEADERS = {"Accept-Encoding": "identity"}
+
+# Downloads by URL, so segments whose searches land on the same stock video
+# share one download. Per-URL locks make concurrent fetches wait for the first.
+# Finished downloads are also recorded in the cache database for later runs.
+_dl_locks: defaultdict[str, threading.Lock] = defaultdict(threading.Lock)
+_dl_done: dict[str, tuple[Path, int, int]] = {}
+
+# Search responses are reused for a day; stock results rarely change faster
+_SEARCH_CACHE_PATH = CACHE_DIR / "pexels_search.sqlite"
+_SEARCH_CACHE_TTL = 24 * 60 * 60
+_search_locks: defaultdict[str, threading.Lock] = defaultdict(threading.Lock)
 
 
 def get_background_video(
@@ -40,36 +104,7 @@ def get_background_video(
         output_path = VIDEO_DIR / "background.mp4"
     output_path = Path(output_path)
 
-    # Search and pick
-    headers = {"Authorization": PEXELS_API_KEY}
-    params = {
-        "query": keyword,
-        "orientation": "portrait",
-        "per_page": 10,
-        "size": "large",
-    }
-    resp = _session.get(_PEXELS_SEARCH_URL, headers=headers, params=params, timeout=15)
-    resp.raise_for_status()
-    videos = resp.json().get("videos", [])
-    if not videos:
-        raise RuntimeError(f"No videos found for keyword='{keyword}'")
-
-    # Filter for videos that have mp4 files
-    valid_videos = []
-    for v in videos:
-        mp4_files = [f for f in v.get("video_files", []) if f.get("file_type", "").startswith("video/mp4")]
-        if mp4_files:
-            v["mp4_files"] = mp4_files
-            valid_videos.append(v)
-
-    if not valid_videos:
-        raise RuntimeError(f"No MP4 files found for keyword='{keyword}' among {len(videos)} videos.")
-
-    chosen = max(valid_videos, key=lambda v: v.get("duration", 0))
-    video_files = chosen["mp4_files"]
-    video_files.sort(key=lambda f: f.get("height", 0), reverse=True)
-    download_url = video_files[0].get("link")
-
+    download_url = _find_video_url(keyword)
     _download_file(download_url, output_path)
     return str(output_path.resolve())
 
@@ -86,60 +121,347 @@ def get_clips_for_script(
     # ── 1. Split script into segments ──
     # Split by period, exclamation, or question mark using regex
     # Handle common abbreviations to avoid splitting prematurely
-    raw_segments = re.split(r'(?<=[.!?])\s+', script.replace("\n", " "))
+    raw_segments = _SENT_SPLIT_RE.split(_WS_RE.sub(" ", script))
     sentences = [s.strip() for s in raw_segments if len(s.strip()) > 5]
 
     if not sentences:
         sentences = [script.strip()]
 
-    # Estimate duration per sentence (simple word count ratio)
-    words = script.split()
-    total_words = len(words)
-    clips_metadata = []
+    # Estimate duration per sentence (simple word count ratio). Split each
+    # sentence once; the counts and keyword snippets both come from it.
+    sentence_words = [s.split() for s in sentences]
+    total_words = sum(len(w) for w in sentence_words) or 1
+    durations = [len(w) / total_words * total_duration for w in sentence_words]
 
-    for i, sentence in enumerate(sentences):
-        sent_words = len(sentence.split())
-        # Percentage of total duration this sentence takes
-        sent_duration = (sent_words / total_words) * total_duration
-        
-        # Combine base keyword with a snippet of the sentence
-        snippet = " ".join(sentence.split()[:3])
-        keyword = f"{base_keyword} {snippet}".strip()
-        
-        logger.info("Fetching clip for segment %d: '%s' (%.1fs)", i+1, keyword, sent_duration)
-        
-        try:
-            filename = f"clip_{i:03d}.mp4"
-            path = VIDEO_DIR / filename
-            clip_path = get_background_video(keyword, sent_duration, output_path=path)
-            clips_metadata.append({
-                "path": clip_path,
-                "duration": sent_duration
-            })
-        except Exception as exc:
-            logger.warning("Failed to fetch clip for '%s': %s. Using fallback.", keyword, exc)
-            # Fallback to a generic keyword if specific one fails
-            if i > 0 and clips_metadata:
-                # Reuse previous clip metadata if possible (it will be looped in engine)
-                clips_metadata.append(clips_metadata[-1])
-            else:
-                # Absolute fallback
-                path = VIDEO_DIR / f"clip_{i:03d}.mp4"
-                clip_path = get_background_video("nature", sent_duration, output_path=path)
-                clips_metadata.append({"path": clip_path, "duration": sent_duration})
+    # ── 2. One search for the whole script ──
+    # Each segment gets its own video from a single base-keyword search
+    # instead of one near-identical search round trip per sentence.
+    try:
+        per_page = min(max(len(sentences), 15), _MAX_PER_PAGE)
+        candidates = [link for v in _search_videos(base_keyword, per_page) if (link := _mp4_link(v))]
+    except Exception as exc:
+        logger.warning("Bulk search for '%s' failed: %s. Searching per segment.", base_keyword, exc)
+        candidates = []
+
+    prefix = f"{base_keyword} " if base_keyword else ""
+
+    def search_clip(i: int) -> str:
+        # Bulk results ran out: search with a snippet of the sentence
+        keyword = (prefix + " ".join(sentence_words[i][:3])).rstrip()
+        logger.info("Searching clip for segment %d: '%s'", i+1, keyword)
+        return _find_video_url(keyword)
+
+    # ── 3. Download all segments concurrently ──
+    # Downloads start as soon as a URL is known: bulk results immediately,
+    # per-segment searches as each one completes, so search round trips
+    # overlap transfers instead of each worker doing search-then-download.
+    results: list[str | None] = [None] * len(sentences)
+    with ThreadPoolExecutor(max_workers=_MAX_SEARCH_WORKERS) as search_pool, \
+         ThreadPoolExecutor(max_workers=_MAX_FETCH_WORKERS) as dl_pool:
+        downloads = {}
+
+        def start_download(i: int, url: str) -> None:
+            logger.info("Fetching clip for segment %d (%.1fs)", i+1, durations[i])
+            path = VIDEO_DIR / f"clip_{i:03d}.mp4"
+            downloads[dl_pool.submit(_download_file, url, path)] = (i, path)
+
+        for i, url in enumerate(candidates[:len(sentences)]):
+            start_download(i, url)
+        searches = {search_pool.submit(search_clip, i): i for i in range(len(candidates), len(sentences))}
+        for fut in as_completed(searches):
+            i = searches[fut]
+            try:
+                start_download(i, fut.result())
+            except Exception as exc:
+                logger.warning("Failed to find clip for segment %d: %s. Using fallback.", i+1, exc)
+
+        for fut in as_completed(downloads):
+            i, path = downloads[fut]
+            try:
+                fut.result()
+                results[i] = str(path.resolve())
+            except Exception as exc:
+                logger.warning("Failed to download clip for segment %d: %s. Using fallback.", i+1, exc)
+
+    # ── 4. Fill failed segments, in script order ──
+    clips_metadata = []
+    for i, (sent_duration, clip_path) in enumerate(zip(durations, results)):
+        if clip_path is not None:
+            clips_metadata.append({"path": clip_path, "duration": sent_duration})
+        elif clips_metadata:
+            # Reuse the previous clip for this segment (it will be looped in engine)
+            clips_metadata.append({"path": clips_metadata[-1]["path"], "duration": sent_duration})
+        else:
+            # Absolute fallback
+            path = VIDEO_DIR / f"clip_{i:03d}.mp4"
+            clip_path = get_background_video("nature", sent_duration, output_path=path)
+            clips_metadata.append({"path": clip_path, "duration": sent_duration})
 
     return clips_metadata
 
 
+def _find_video_url(keyword: str) -> str:
+    """Search Pexels for *keyword* and return the download link of the longest MP4 result."""
+    videos = _search_videos(keyword)
+    if not videos:
+        raise RuntimeError(f"No videos found for keyword='{keyword}'")
+
+    # Filter for videos that have mp4 files
+    valid_videos = [(v, link) for v in videos if (link := _mp4_link(v))]
+
+    if not valid_videos:
+        raise RuntimeError(f"No MP4 files found for keyword='{keyword}' among {len(videos)} videos.")
+
+    _, download_url = max(valid_videos, key=lambda vl: vl[0].get("duration", 0))
+    return download_url
+
+
+def _mp4_link(video: dict) -> str | None:
+    """Download link of the MP4 rendition to use for a Pexels *video*, if any."""
+    mp4_files = [f for f in video.get("video_files", []) if f.get("file_type", "").startswith("video/mp4")]
+    if not mp4_files:
+        return None
+    # Smallest rendition at least as tall as the output: anything bigger (4K)
+    # is only downloaded and decoded to be scaled back down to 1920.
+    best = min(mp4_files, key=lambda f: (f.get("height", 0) < VIDEO_HEIGHT, abs(f.get("height", 0) - VIDEO_HEIGHT)))
+    return best.get("link")
+
+
+def _search_videos(keyword: str, per_page: int = 10) -> list[dict]:
+    """
+    Return Pexels search results for *keyword*, served from the on-disk
+    cache when the same query was made within the last day.
+    """
+    params = {
+        "query": keyword,
+        "orientation": "portrait",
+        "per_page": per_page,
+        "size": "large",
+    }
+    key = hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+    # Segments with the same keyword search concurrently; the first one
+    # fills the cache and the rest wait for it instead of calling the API.
+    with _search_locks[key]:
+        cached = _search_cache_get(key)
+        if cached is not None:
+            logger.debug("Search cache hit for '%s'", keyword)
+            return cached.get("videos", [])
+
+        resp = _session.get(_PEXELS_SEARCH_URL, headers=_AUTH_HEADERS, params=params, timeout=15)
+        resp.raise_for_status()
+        videos = _slim_videos(_json_loads(resp.content).get("videos", []))
+        _search_cache_put(key, json.dumps({"videos": videos}, separators=(",", ":")))
+    return videos
+
+
+def _slim_videos(videos: list[dict]) -> list[dict]:
+    """
+    Keep only the fields clip selection reads. Pexels results also carry
+    user info, tags, previews and every rendition, which would otherwise be
+    cached and re-parsed on each cache hit.
+    """
+    return [
+        {
+            "duration": v.get("duration", 0),
+            "video_files": [
+                {k: f[k] for k in ("file_type", "height", "link") if k in f}
+                for f in v.get("video_files", [])
+                if (f.get("file_type") or "").startswith("video/mp4")
+            ],
+        }
+        for v in videos
+    ]
+
+
+def _cache_db() -> closing:
+    """Open the search/download cache, creating its tables on first use."""
+    conn = sqlite3.connect(_SEARCH_CACHE_PATH, timeout=5)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS searches "
+        "(key TEXT PRIMARY KEY, fetched_at REAL, payload BLOB)"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS downloads "
+        "(url TEXT PRIMARY KEY, path TEXT, size INTEGER, mtime_ns INTEGER)"
+    )
+    return closing(conn)
+
+
+def _search_cache_get(key: str) -> dict | None:
+    """Return the cached search payload for *key* if present and fresh."""
+    try:
+        with _cache_db() as conn:
+            row = conn.execute(
+                "SELECT fetched_at, payload FROM searches WHERE key = ?", (key,)
+            ).fetchone()
+    except sqlite3.Error as exc:
+        logger.debug("Search cache unavailable: %s", exc)
+        return None
+
+    if row is None or time.time() - row[0] > _SEARCH_CACHE_TTL:
+        return None
+    payload = row[1]
+    try:
+        # Older entries were stored as plain JSON text
+        if isinstance(payload, bytes):
+            payload = gzip.decompress(payload)
+        return _json_loads(payload)
+    except (OSError, EOFError, ValueError):
+        return None
+
+
+def _search_cache_put(key: str, payload: str) -> None:
+    """Store a raw search response; cache failures never break a fetch."""
+    try:
+        with _cache_db() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO searches (key, fetched_at, payload) VALUES (?, ?, ?)",
+                (key, time.time(), gzip.compress(payload.encode("utf-8"), compresslevel=6)),
+            )
+            conn.commit()
+    except sqlite3.Error as exc:
+        logger.debug("Could not write search cache: %s", exc)
+
+
+def _download_record_get(url: str) -> tuple[Path, int, int] | None:
+    """Where an earlier run downloaded *url* to, with its size and mtime."""
+    try:
+        with _cache_db() as conn:
+            row = conn.execute(
+                "SELECT path, size, mtime_ns FROM downloads WHERE url = ?", (url,)
+            ).fetchone()
+    except sqlite3.Error as exc:
+        logger.debug("Download records unavailable: %s", exc)
+        return None
+    return (Path(row[0]), row[1], row[2]) if row else None
+
+
+def _download_record_put(url: str, record: tuple[Path, int, int]) -> None:
+    """Remember a finished download so later runs can reuse the file."""
+    path, size, mtime_ns = record
+    try:
+        with _cache_db() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO downloads (url, path, size, mtime_ns) VALUES (?, ?, ?, ?)",
+                (url, str(path), size, mtime_ns),
+            )
+            conn.commit()
+    except sqlite3.Error as exc:
+        logger.debug("Could not write download record: %s", exc)
+
+
 def _download_file(url: str, output_path: Path) -> None:
     """Helper to download a file with temp-rename protection."""
-    dl_resp = _session.get(url, stream=True, timeout=120)
-    dl_resp.raise_for_status()
-
-    tmp_path = output_path.with_suffix(".tmp")
-    with open(tmp_path, "wb") as fh:
-        for chunk in dl_resp.iter_content(chunk_size=1024 * 1024):
-            if chunk:
-                fh.write(chunk)
-    
-    tmp_path.replace(output_path)
+    with _dl_locks[url]:
+        if not _reuse_download(url, output_path):
+            _fetch_to_file(url, output_path)
+            st = output_path.stat()
+            _dl_done[url] = (output_path, st.st_size, st.st_mtime_ns)
+            _download_record_put(url, _dl_done[url])
+
+
+def _reuse_download(url: str, output_path: Path) -> bool:
+    """Link an earlier download of *url* to *output_path*; False if there is none."""
+    done = _dl_done.get(url) or _download_record_get(url)
+    if done is None:
+        return False
+    existing, size, mtime_ns = done
+    try:
+        st = existing.stat()
+    except OSError:
+        return False
+    # Clip files are overwritten between runs; only trust an unchanged file
+    if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+        return False
+    if existing == output_path:
+        return True
+
+    fd, tmp_path = _temp_sibling(output_path)
+    os.close(fd)
+    try:
+        try:
+            # os.link never overwrites, so release the reserved name first
+            tmp_path.unlink()
+            os.link(existing, tmp_path)
+            st = tmp_path.stat()
+        except OSError:
+            # No hard links here (e.g. FAT or some Windows setups): copy from
+            # an open handle so the check below covers the bytes copied
+            with open(existing, "rb") as src:
+                st = os.fstat(src.fileno())
+                if (st.st_size, st.st_mtime_ns) == (size, mtime_ns):
+                    with open(tmp_path, "wb") as dst:
+                        shutil.copyfileobj(src, dst, _DOWNLOAD_CHUNK_SIZE)
+        # Re-check what was actually linked or copied: another download may
+        # have replaced the file at *existing* since the stat above.
+        if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+            tmp_path.unlink(missing_ok=True)
+            return False
+        tmp_path.replace(output_path)
+    except OSError:
+        # The recorded file vanished or could not be read; download afresh
+        tmp_path.unlink(missing_ok=True)
+        return False
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    logger.info("Reusing downloaded clip %s for %s", existing.name, output_path.name)
+    return True
+
+
+def _temp_sibling(path: Path) -> tuple[int, Path]:
+    """
+    Create a uniquely named temp file next to *path* and return its open fd
+    and path. Same directory means os.replace onto *path* is atomic, and a
+    unique name means concurrent writers never share a temp file.
+    """
+    fd, name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    return fd, Path(name)
+
+
+def _preallocate(fd: int, content_length: str | None) -> bool:
+    """
+    Reserve *content_length* bytes for *fd* so large MP4s are laid out in
+    few extents instead of growing block by block. Returns True if done.
+    """
+    if not hasattr(os, "posix_fallocate"):
+        return False
+    try:
+        size = int(content_length or 0)
+        if size <= 0:
+            return False
+        os.posix_fallocate(fd, 0, size)
+    except (ValueError, OSError):
+        # Bad header, or a filesystem without fallocate support
+        return False
+    return True
+
+
+def _fetch_to_file(url: str, output_path: Path) -> None:
+    """Stream *url* into *output_path* via a temp file."""
+    fd, tmp_path = _temp_sibling(output_path)
+    try:
+        # Keep the buffered writer: a raw FileIO write may be short and
+        # copyfileobj ignores the count, while BufferedWriter retries until
+        # every byte lands (large chunks still bypass its buffer). The
+        # response is a context manager too, so its pooled connection goes
+        # back even when the status check or the copy fails.
+        with os.fdopen(fd, "wb") as fh, \
+             _session.get(url, headers=_DOWNLOAD_HEADERS, stream=True, timeout=120) as dl_resp:
+            dl_resp.raise_for_status()
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(fh.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            preallocated = _preallocate(fh.fileno(), dl_resp.headers.get("Content-Length"))
+            # Read straight from the socket stream; decode_content keeps any
+            # Content-Encoding handling that iter_content would have done.
+            dl_resp.raw.decode_content = True
+            shutil.copyfileobj(dl_resp.raw, fh, _DOWNLOAD_CHUNK_SIZE)
+            if preallocated:
+                # Decoded bodies can differ from Content-Length; never keep
+                # padding. truncate() flushes the buffer before cutting.
+                fh.truncate(fh.tell())
+        tmp_path.replace(output_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise